@@ -20,6 +20,7 @@
  #include <set>
  #include <limits>
  #include <iomanip>
+ #include <memory>
  
  /*
   * Use, always, the namespace ns3. All the NR classes are inside such namespace.
@@ -38,17 +39,24 @@ std::ofstream flowStatsFile;
 std::ofstream handoverFile;
 std::ofstream positionFile;
 std::ofstream powerFile;
+std::string tracePrefix; // --tracePrefix, prepended verbatim; empty keeps the plain file names
 
 // ========== GLOBAL VARIABLES FOR HANDOVER TRACKING ==========
-std::map<FlowId, FlowMonitor::FlowStats> lastFlowStats;
+// Counters kept from the previous flow sample (FlowStats also carries histograms we don't need)
+struct FlowSample {
+    uint32_t rxPackets = 0;
+    uint64_t rxBytes = 0;
+    Time delaySum;
+    Time jitterSum;
+    uint32_t lostPackets = 0;
+};
+std::map<FlowId, FlowSample> lastFlowStats;
 std::map<uint32_t, uint32_t> previousServingCell;
-std::map<uint32_t, Vector> lastUePositions;
 std::map<uint32_t, double> lastRefereeActivityTime;
 std::set<uint32_t> refereeNodeIds;
+std::vector<Vector> gnbPositions; // gNBs are static: positions read once in main()
+std::map<Ipv4Address, uint32_t> ueNodeIdByIp; // Filled on first sight of each UE address
 bool flowStatsHeaderWritten = false;
-bool handoverHeaderWritten = false;
-bool positionHeaderWritten = false;
-bool powerHeaderWritten = false;
 uint32_t handoverCount = 0;
 uint32_t manualHandoverCount = 0;
 
@@ -65,27 +73,35 @@ const double CATWALK_HEIGHT = 35.0;    // Height of gNBs on catwalk
 const double CAMPO_RADIUS = 55.0;      // Radius of field where referees move
 const double ARBITRO_HEIGHT = 1.7;     // Height of referees
 const double ARBITRO_SPEED = 5.0;      // Speed of referees (m/s) - at 15s of simulation the referees will be able to move 75 meters
+const double ARBITRO_STEP_ANGLE = (ARBITRO_SPEED * 0.5) / CAMPO_RADIUS; // Angle covered per 0.5s movement step
+
+// ========== SIMPLIFIED RSRP MODEL (3GPP UMi) ==========
+const double RSRP_GNB_POWER = 35.0;                          // gNB power (dBm)
+const double PATHLOSS_CONST = 32.4 + 20.0 * log10(3.7);      // Distance-independent path loss term at 3.7 GHz (dB)
 
 // ========== REFEREE CIRCULAR MOVEMENT FUNCTION ==========
 void MoveArbitroCircular(Ptr<Node> ue, uint32_t ueId)
 {
     Ptr<MobilityModel> mobility = ue->GetObject<MobilityModel>();
     
-    // Maintain unique angles for each referee
-    static std::map<uint32_t, double> ueAngles;
-    if (ueAngles.find(ueId) == ueAngles.end())
+    // Maintain unique angles for each referee, stored contiguously by ueId
+    static std::vector<double> ueAngles;
+    if (ueId >= ueAngles.size())
     {
         // Initially distribute referees
-        ueAngles[ueId] = (ueId * 2.0 * M_PI) / 4.0;
+        for (uint32_t id = ueAngles.size(); id <= ueId; ++id)
+        {
+            ueAngles.push_back((id * 2.0 * M_PI) / 4.0);
+        }
     }
+    double& angle = ueAngles[ueId];
     
-    // Calculate angle increment based on speed
-    double deltaAngle = (ARBITRO_SPEED * 0.5) / CAMPO_RADIUS; // 0.5s interval
-    ueAngles[ueId] += deltaAngle;
+    // Advance by the per-step angle increment
+    angle += ARBITRO_STEP_ANGLE;
     
     // Calculate new circular position
-    double newX = CAMPO_RADIUS * cos(ueAngles[ueId]);
-    double newY = CAMPO_RADIUS * sin(ueAngles[ueId]);
+    double newX = CAMPO_RADIUS * cos(angle);
+    double newY = CAMPO_RADIUS * sin(angle);
     
     // Update position maintaining height
     mobility->SetPosition(Vector(newX, newY, ARBITRO_HEIGHT));
@@ -103,8 +119,8 @@ void TrackUePosition(Ptr<Node> ue, uint32_t ueId)
 {
     if (!positionFile.is_open())
     {
-        positionFile.open("ue_positions_stadium.csv");
-        positionFile << "Time,UE_ID,X,Y,Z,Speed_ms" << std::endl;
+        positionFile.open(tracePrefix + "ue_positions_stadium.csv");
+        positionFile << "Time,UE_ID,X,Y,Z,Speed_ms" << '\n';
     }
     
     Ptr<MobilityModel> mobility = ue->GetObject<MobilityModel>();
@@ -118,7 +134,7 @@ void TrackUePosition(Ptr<Node> ue, uint32_t ueId)
                 << pos.x << ","
                 << pos.y << ","
                 << pos.z << ","
-                << speed << std::endl;
+                << speed << '\n';
     
     
     if (Simulator::Now().GetSeconds() < 14.5)
@@ -134,7 +150,7 @@ void PeriodicPositionReport(NodeContainer ueNodes)
     double currentTime = Simulator::Now().GetSeconds();
     
     // Readable time format (fixed to avoid exponential notation)
-    std::cout << std::fixed << std::setprecision(1) << "\n📍 [" << currentTime << "s] Position Report:" << std::endl;
+    std::cout << std::fixed << std::setprecision(1) << "\n📍 [" << currentTime << "s] Position Report:" << '\n';
     
     for (uint32_t i = 0; i < ueNodes.GetN(); ++i)
     {
@@ -146,8 +162,9 @@ void PeriodicPositionReport(NodeContainer ueNodes)
         std::cout << std::fixed << std::setprecision(1)
                   << "   Camera " << i << ": ("
                   << pos.x << ", " << pos.y << ", " << pos.z
-                  << ") - Speed: " << std::setprecision(2) << speed << " m/s" << std::endl;
+                  << ") - Speed: " << std::setprecision(2) << speed << " m/s" << '\n';
     }
+    std::cout << std::flush; // one flush per report instead of one per camera
     
     // Schedule next report
     if (currentTime < 14.5)
@@ -158,12 +175,12 @@ void PeriodicPositionReport(NodeContainer ueNodes)
 
 
 // ========== POWER MEASUREMENT AND HANDOVER DETECTION FUNCTION ==========
-void LogPowerAndHandover(Ptr<Node> ue, uint32_t ueId, NodeContainer gnbNodes)
+void LogPowerAndHandover(Ptr<Node> ue, uint32_t ueId)
 {
     if (!powerFile.is_open())
     {
-        powerFile.open("power_measurements_stadium.csv");
-        powerFile << "Time,UE_ID,Best_gNB_ID,RSRP_dBm,Distance_m,Handover_Event" << std::endl;
+        powerFile.open(tracePrefix + "power_measurements_stadium.csv");
+        powerFile << "Time,UE_ID,Best_gNB_ID,RSRP_dBm,Distance_m,Handover_Event" << '\n';
     }
     
     Ptr<MobilityModel> ueMobility = ue->GetObject<MobilityModel>();
@@ -173,37 +190,48 @@ void LogPowerAndHandover(Ptr<Node> ue, uint32_t ueId, NodeContainer gnbNodes)
     uint32_t bestGnbId = 0;
     double bestDistance = 0.0;
     
-    // Find the gNB with best RSRP
-    for (uint32_t gnbId = 0; gnbId < gnbNodes.GetN(); ++gnbId)
+    // Find the gNB with best RSRP. RSRP decreases monotonically with distance,
+    // so the closest gNB (by squared 3D distance) is the best one.
+    double minDist2 = std::numeric_limits<double>::max();
+    uint32_t closestGnbId = 0;
+    for (uint32_t gnbId = 0; gnbId < gnbPositions.size(); ++gnbId)
     {
-        Ptr<Node> gnbNode = gnbNodes.Get(gnbId);
-        Ptr<MobilityModel> gnbMobility = gnbNode->GetObject<MobilityModel>();
-        Vector gnbPos = gnbMobility->GetPosition();
+        const Vector& gnbPos = gnbPositions[gnbId];
             
-            // Calculate 3D distance
-            double distance = std::sqrt(
-                std::pow(uePos.x - gnbPos.x, 2) +
-                std::pow(uePos.y - gnbPos.y, 2) +
-                std::pow(uePos.z - gnbPos.z, 2)
-            );
+            double dx = uePos.x - gnbPos.x;
+            double dy = uePos.y - gnbPos.y;
+            double dz = uePos.z - gnbPos.z;
+            double dist2 = dx*dx + dy*dy + dz*dz;
             
-            // Simplified RSRP model (3GPP UMi)
-            double pathLoss = 32.4 + 21.0 * log10(distance) + 20.0 * log10(3.7);
-            double rsrp = 35.0 - pathLoss; // 35 dBm gNB power
-            
-            if (rsrp > bestRsrp)
+            if (dist2 < minDist2)
             {
-                bestRsrp = rsrp;
-                bestGnbId = gnbId;
-                bestDistance = distance;
+                minDist2 = dist2;
+                closestGnbId = gnbId;
             }
         }
+    
+    if (!gnbPositions.empty())
+    {
+        // Simplified RSRP model (3GPP UMi), evaluated only for the closest gNB
+        double distance = std::sqrt(minDist2);
+        double pathLoss = PATHLOSS_CONST + 21.0 * log10(distance);
+        double rsrp = RSRP_GNB_POWER - pathLoss;
+        
+        if (rsrp > bestRsrp)
+        {
+            bestRsrp = rsrp;
+            bestGnbId = closestGnbId;
+            bestDistance = distance;
+        }
+    }
         
         // Detect cell change (handover)
         bool handoverDetected = false;
-        if (previousServingCell.find(ueId) != previousServingCell.end())
+        auto servingIt = previousServingCell.find(ueId);
+        if (servingIt != previousServingCell.end())
         {
-            if (previousServingCell[ueId] != bestGnbId)
+            uint32_t sourceGnbId = servingIt->second;
+            if (sourceGnbId != bestGnbId)
             {
                 handoverDetected = true;
                 handoverCount++;
@@ -215,25 +243,28 @@ void LogPowerAndHandover(Ptr<Node> ue, uint32_t ueId, NodeContainer gnbNodes)
                 // Detailed handover log
                 if (!handoverFile.is_open())
                 {
-                    handoverFile.open("handover_log_stadium.txt");
+                    handoverFile.open(tracePrefix + "handover_log_stadium.txt");
                 }
                 
                 handoverFile << std::fixed << std::setprecision(6)
                            << "[" << Simulator::Now().GetSeconds() << "s] "
                            << "HANDOVER: Referee_" << ueId 
-                           << " gNB_" << previousServingCell[ueId] << " -> gNB_" << bestGnbId
+                           << " gNB_" << sourceGnbId << " -> gNB_" << bestGnbId
                            << " (RSRP: " << std::setprecision(1) << bestRsrp << " dBm)"
                            << " (Dist: " << std::setprecision(1) << bestDistance << " m)"
-                           << " [Total_HOs: " << handoverCount << "]" << std::endl;
+                           << " [Total_HOs: " << handoverCount << "]" << '\n';
                 
                 std::cout << "[HANDOVER] T=" << std::setprecision(3) << Simulator::Now().GetSeconds() 
-                         << "s Referee_" << ueId << ": gNB_" << previousServingCell[ueId] 
+                         << "s Referee_" << ueId << ": gNB_" << sourceGnbId 
                          << " -> gNB_" << bestGnbId 
                          << " (RSRP=" << std::setprecision(1) << bestRsrp << "dBm)" << std::endl;
             }
+            servingIt->second = bestGnbId;
+        }
+        else
+        {
+            previousServingCell.emplace(ueId, bestGnbId);
         }
-        
-    previousServingCell[ueId] = bestGnbId;
     
     // Save measurement to CSV file (readable time format)
     double currentTime = Simulator::Now().GetSeconds();
@@ -243,12 +274,12 @@ void LogPowerAndHandover(Ptr<Node> ue, uint32_t ueId, NodeContainer gnbNodes)
              << bestGnbId << ","
              << std::setprecision(1) << bestRsrp << ","
              << std::setprecision(1) << bestDistance << ","
-             << (handoverDetected ? "YES" : "NO") << std::endl;
+             << (handoverDetected ? "YES" : "NO") << '\n';
     
     // Reschedule next measurement
     if (Simulator::Now().GetSeconds() < 14.5)
     {
-        Simulator::Schedule(Seconds(0.5), &LogPowerAndHandover, ue, ueId, gnbNodes);
+        Simulator::Schedule(Seconds(0.5), &LogPowerAndHandover, ue, ueId);
     }
 }
 
@@ -335,38 +366,50 @@ TraceFlowMonitorStats(Ptr<FlowMonitor> monitor, Ptr<Ipv4FlowClassifier> classifi
 {
     if (!flowStatsFile.is_open())
     {
-        flowStatsFile.open("flow_stats.csv", std::ios_base::out);
+        flowStatsFile.open(tracePrefix + "flow_stats.csv", std::ios_base::out);
     }
 
     if (!flowStatsHeaderWritten)
     {
-        flowStatsFile << "Time,UeId,FlowId,Direction,SrcAddr,DstAddr,Throughput_kbps,Latency_ms,Jitter_ms,PacketLoss" << std::endl;
+        flowStatsFile << "Time,UeId,FlowId,Direction,SrcAddr,DstAddr,Throughput_kbps,Latency_ms,Jitter_ms,PacketLoss" << '\n';
         flowStatsHeaderWritten = true;
     }
 
     monitor->CheckForLostPackets();
-    FlowMonitor::FlowStatsContainer stats = monitor->GetFlowStats();
+    const FlowMonitor::FlowStatsContainer& stats = monitor->GetFlowStats();
+
+    // UE address pool, parsed once rather than for every flow on every tick
+    static const Ipv4Mask ueSubnetMask("255.0.0.0");
+    static const Ipv4Address ueSubnet("7.0.0.0");
 
     for (auto const& [flowId, flowStats] : stats)
     {
         Ipv4FlowClassifier::FiveTuple t = classifier->FindFlow(flowId);
         
-        Ipv4Mask ueSubnetMask("255.0.0.0");
-        Ipv4Address ueSubnet("7.0.0.0");
-        std::string direction = (t.sourceAddress.CombineMask(ueSubnetMask) == ueSubnet) ? "UL" : "DL";
+        bool isUplink = (t.sourceAddress.CombineMask(ueSubnetMask) == ueSubnet);
         
         uint32_t ueId = 0;
-        Ipv4Address ueIp = (direction == "UL") ? t.sourceAddress : t.destinationAddress;
-        for(uint32_t i = 0; i < NodeList::GetNNodes(); ++i)
+        Ipv4Address ueIp = isUplink ? t.sourceAddress : t.destinationAddress;
+        auto ipIt = ueNodeIdByIp.find(ueIp);
+        if (ipIt != ueNodeIdByIp.end())
+        {
+            ueId = ipIt->second;
+        }
+        else
         {
-            Ptr<Ipv4> ipv4 = NodeList::GetNode(i)->GetObject<Ipv4>();
-            if (ipv4 && ipv4->GetNInterfaces() > 1) 
+            // Scan the node list only the first time this address is seen
+            for(uint32_t i = 0; i < NodeList::GetNNodes(); ++i)
             {
-                Ipv4Address addr = ipv4->GetAddress(1, 0).GetLocal();
-                if (addr == ueIp)
+                Ptr<Ipv4> ipv4 = NodeList::GetNode(i)->GetObject<Ipv4>();
+                if (ipv4 && ipv4->GetNInterfaces() > 1) 
                 {
-                    ueId = NodeList::GetNode(i)->GetId();
-                    break;
+                    Ipv4Address addr = ipv4->GetAddress(1, 0).GetLocal();
+                    if (addr == ueIp)
+                    {
+                        ueId = NodeList::GetNode(i)->GetId();
+                        ueNodeIdByIp.emplace(ueIp, ueId);
+                        break;
+                    }
                 }
             }
         }
@@ -378,10 +421,11 @@ TraceFlowMonitorStats(Ptr<FlowMonitor> monitor, Ptr<Ipv4FlowClassifier> classifi
         uint32_t currentPacketLoss = 0;
 
         bool rxIncreased = false;
-        auto it = lastFlowStats.find(flowId);
-        if (it != lastFlowStats.end())
+        // Single lookup: inserts an empty sample the first time a flow is seen
+        auto [it, firstSample] = lastFlowStats.try_emplace(flowId);
+        if (!firstSample)
         {
-            const FlowMonitor::FlowStats& lastStats = it->second;
+            const FlowSample& lastStats = it->second;
             if (flowStats.rxPackets > lastStats.rxPackets)
             {
                 rxIncreased = true;
@@ -401,9 +445,10 @@ TraceFlowMonitorStats(Ptr<FlowMonitor> monitor, Ptr<Ipv4FlowClassifier> classifi
             currentPacketLoss = flowStats.lostPackets;
         }
         
-        lastFlowStats[flowId] = flowStats;
+        it->second = {flowStats.rxPackets, flowStats.rxBytes, flowStats.delaySum,
+                      flowStats.jitterSum, flowStats.lostPackets};
 
-        if (direction == "UL" && rxIncreased && refereeNodeIds.find(ueId) != refereeNodeIds.end())
+        if (isUplink && rxIncreased && refereeNodeIds.find(ueId) != refereeNodeIds.end())
         {
             lastRefereeActivityTime[ueId] = Simulator::Now().GetSeconds();
         }
@@ -411,13 +456,13 @@ TraceFlowMonitorStats(Ptr<FlowMonitor> monitor, Ptr<Ipv4FlowClassifier> classifi
         flowStatsFile << Simulator::Now().GetSeconds() << ","
                       << ueId << ","
                       << flowId << ","
-                      << direction << ","
+                      << (isUplink ? "UL" : "DL") << ","
                       << t.sourceAddress << ","
                       << t.destinationAddress << ","
                       << currentThroughput << ","
                       << currentLatency << ","
                       << currentJitter << ","
-                      << currentPacketLoss << std::endl;
+                      << currentPacketLoss << '\n';
     }
     Simulator::Schedule(Seconds(0.1), &TraceFlowMonitorStats, monitor, classifier);
 }
@@ -482,7 +527,8 @@ void PrintFinalStats()
      uint32_t cameraBitRate = 35000000;   // 35 Mbps as per user requirements
      bool doubleOperationalBand = false;
      bool traces = false;
-     bool anim = true;
+     bool anim = false; // A live NetAnim trace records every packet of the run
+     Time animPollInterval = MilliSeconds(250);  // NetAnim mobility sampling period (ns-3 default)
  
      // Traffic parameters for different profiles
      // Profile 1: Mobile referees (4 UEs) - 35 Mbps configured for guaranteed 5+ Mbps effective
@@ -531,6 +577,14 @@ void PrintFinalStats()
      cmd.AddValue("gNbNum", "The number of gNbs in multiple-ue topology", gNbNum);
      cmd.AddValue("ueNumPergNb", "The number of UE per gNb in multiple-ue topology", ueNumPergNb);
      cmd.AddValue("logging", "Enable logging", logging);
+     cmd.AddValue("traces", "Enable the NR module traces", traces);
+     cmd.AddValue("anim",
+                  "Generate the NetAnim XML trace (handover_animation_15s.xml); "
+                  "records every packet with metadata, so it is off by default",
+                  anim);
+     cmd.AddValue("animPollInterval",
+                  "Period at which NetAnim samples node positions; larger values mean fewer frames",
+                  animPollInterval);
      cmd.AddValue("doubleOperationalBand",
                   "If true, simulate two operational bands with one CC for each band,"
                   "and each CC will have 1 BWP that spans the entire CC.",
@@ -556,6 +610,10 @@ void PrintFinalStats()
                   "tag to be appended to output filenames to distinguish simulation campaigns",
                   simTag);
      cmd.AddValue("outputDir", "directory where to store simulation results", outputDir);
+     cmd.AddValue("tracePrefix",
+                  "prefix prepended to the trace file names (e.g. a per-run directory or tag); "
+                  "empty keeps the default names",
+                  tracePrefix);
  
      // Parse the command line
      cmd.Parse(argc, argv);
@@ -808,7 +866,8 @@ void PrintFinalStats()
 
 
     std::cout << "\n=== gNB Positions ===" << std::endl;
-    std::vector<Vector> gnbPositions;
+    gnbPositions.clear();
+    gnbPositions.reserve(gnbNodes.GetN());
     for (uint32_t i = 0; i < gnbNodes.GetN(); ++i)
     {
         Ptr<Node> gnb = gnbNodes.Get(i);
@@ -825,18 +884,18 @@ void PrintFinalStats()
         Ptr<MobilityModel> mob = ue->GetObject<MobilityModel>();
         Vector uePos = mob->GetPosition();
 
-        // Find the closest gNB
-        double minDist = std::numeric_limits<double>::max();
+        // Find the closest gNB (squared distance is enough to rank them)
+        double minDist2 = std::numeric_limits<double>::max();
         int gnbIndex = -1;
         for (uint32_t j = 0; j < gnbPositions.size(); ++j)
         {
-            double dist = std::sqrt(
-                std::pow(uePos.x - gnbPositions[j].x, 2) +
-                std::pow(uePos.y - gnbPositions[j].y, 2) +
-                std::pow(uePos.z - gnbPositions[j].z, 2));
-            if (dist < minDist)
+            double dx = uePos.x - gnbPositions[j].x;
+            double dy = uePos.y - gnbPositions[j].y;
+            double dz = uePos.z - gnbPositions[j].z;
+            double dist2 = dx*dx + dy*dy + dz*dz;
+            if (dist2 < minDist2)
             {
-                minDist = dist;
+                minDist2 = dist2;
                 gnbIndex = j;
             }
         }
@@ -988,8 +1047,12 @@ std::cout << "- 4K Cameras: " << camera4kNodes.GetN() << " UEs @ " << targetRate
       *
       */
  
-     Packet::EnableChecking();
-     Packet::EnablePrinting();
+     // Per-packet metadata is only consumed by the NetAnim trace (EnablePacketMetadata);
+     // it must be enabled before any packet is created
+     if (anim)
+     {
+         Packet::EnablePrinting();
+     }
  
      /*
       *  Case (i): Attributes valid for all the nodes
@@ -1240,8 +1303,6 @@ std::cout << "- 4K Cameras: " << camera4kNodes.GetN() << " UEs @ " << targetRate
      */
  
 
-     Packet::EnablePrinting();
-
      
      // Set the default gateway for the UEs
      for (uint32_t j = 0; j < ueNodes.GetN(); ++j)
@@ -1260,6 +1321,17 @@ std::cout << "- 4K Cameras: " << camera4kNodes.GetN() << " UEs @ " << targetRate
 
     // ========== VALIDATION CELL ==========
     std::cout << "\n--- Verify cell (gNB) to attach Inicial UEs ---" << std::endl;
+    // Index gNB devices by CellId once instead of scanning all of them for every UE
+    std::map<uint16_t, Ptr<NrGnbNetDevice>> gnbByCellId;
+    for (uint32_t j = 0; j < gnbNetDev.GetN(); ++j)
+    {
+        Ptr<NrGnbNetDevice> gnbDev = DynamicCast<NrGnbNetDevice>(gnbNetDev.Get(j));
+        if (gnbDev)
+        {
+            gnbByCellId.emplace(gnbDev->GetCellId(), gnbDev);
+        }
+    }
+
     for (uint32_t i = 0; i < ueVideoNetDev.GetN(); ++i)
     {
         Ptr<NetDevice> ueDev = ueVideoNetDev.Get(i);
@@ -1272,14 +1344,10 @@ std::cout << "- 4K Cameras: " << camera4kNodes.GetN() << " UEs @ " << targetRate
             
             Ptr<NrGnbNetDevice> servingGnb = nullptr;
             // Encontrar a gNB que corresponde ao CellId
-            for (uint32_t j = 0; j < gnbNetDev.GetN(); ++j)
+            auto gnbIt = gnbByCellId.find(servingCellId);
+            if (gnbIt != gnbByCellId.end())
             {
-                Ptr<NrGnbNetDevice> gnbDev = DynamicCast<NrGnbNetDevice>(gnbNetDev.Get(j));
-                if (gnbDev && gnbDev->GetCellId() == servingCellId)
-                {
-                    servingGnb = gnbDev;
-                    break;
-                }
+                servingGnb = gnbIt->second;
             }
 
             if (servingGnb)
@@ -1461,12 +1529,6 @@ std::cout << "- 4K Cameras: " << camera4kNodes.GetN() << " UEs @ " << targetRate
      serverApps.Stop(simTime);
      clientApps.Stop(simTime);
  
-     // enable the traces provided by the nr module
-     if (traces)
-     {
-         nrHelper->EnableTraces();
-     }
- 
      FlowMonitorHelper flowmonHelper;
      NodeContainer endpointNodes;
      endpointNodes.Add(remoteHost);
@@ -1500,43 +1562,46 @@ std::cout << "- 4K Cameras: " << camera4kNodes.GetN() << " UEs @ " << targetRate
     std::cout << "---------------------------------------------------------------" << std::endl;
 
 
+// The interface must outlive Simulator::Run() to sample positions and packets
+std::unique_ptr<AnimationInterface> animInterface;
 if (anim)
 {     
     // --- ANIMATION BLOCK START ---
-    AnimationInterface anim("handover_animation_15s.xml");
-    anim.SetMaxPktsPerTraceFile(500000);
-    anim.EnablePacketMetadata(true);
+    animInterface = std::make_unique<AnimationInterface>(tracePrefix + "handover_animation_15s.xml");
+    animInterface->SetMaxPktsPerTraceFile(500000);
+    animInterface->SetMobilityPollInterval(animPollInterval);
+    animInterface->EnablePacketMetadata(true);
   
-    // anim.EnableIpv4RouteTracking("routingtable-wireless.xml", Seconds(0), Seconds(10), Seconds(0.25)); // Opcional, se quiser ver rotas
+    // animInterface->EnableIpv4RouteTracking("routingtable-wireless.xml", Seconds(0), Seconds(10), Seconds(0.25)); // Opcional, se quiser ver rotas
 
 
-    anim.SetBackgroundImage("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/maracana.png", -365, -270, 0.6, 0.6, 1);
+    animInterface->SetBackgroundImage("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/maracana.png", -365, -270, 0.6, 0.6, 1);
 
-    uint32_t ueIcon = anim.AddResource("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/cam.png");
-    uint32_t gnbIcon = anim.AddResource("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/gnb.png");
-    uint32_t serverIcon = anim.AddResource("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/remotehost.png");
-    uint32_t mmeIcon = anim.AddResource("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/mme.png");
-    uint32_t pgwIcon = anim.AddResource("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/pgw.png");
-    uint32_t sgwIcon = anim.AddResource("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/sgw.png");
+    uint32_t ueIcon = animInterface->AddResource("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/cam.png");
+    uint32_t gnbIcon = animInterface->AddResource("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/gnb.png");
+    uint32_t serverIcon = animInterface->AddResource("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/remotehost.png");
+    uint32_t mmeIcon = animInterface->AddResource("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/mme.png");
+    uint32_t pgwIcon = animInterface->AddResource("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/pgw.png");
+    uint32_t sgwIcon = animInterface->AddResource("/Users/carloshenriquelopes/ns-3-dev/scratch/icons/sgw.png");
 
     // Iterate over ALL gNBs to apply icon
     for (uint32_t i = 0; i < gnbNodes.GetN(); ++i)
     {
-        anim.UpdateNodeImage(gnbNodes.Get(i)->GetId(), gnbIcon);
+        animInterface->UpdateNodeImage(gnbNodes.Get(i)->GetId(), gnbIcon);
     }
 
     // Iterate over all UEs (already correct)
     for (uint32_t i = 0; i < ueNodes.GetN(); ++i)
     {
-        anim.UpdateNodeImage(ueNodes.Get(i)->GetId(), ueIcon);
+        animInterface->UpdateNodeImage(ueNodes.Get(i)->GetId(), ueIcon);
     }
 
-    anim.UpdateNodeImage(pgw->GetId(), sgwIcon);
-    anim.UpdateNodeImage(sgw->GetId(), pgwIcon);
-    anim.UpdateNodeImage(22, mmeIcon); // add icon to Node 22
-    anim.UpdateNodeImage(mme->GetId(), mmeIcon);
+    animInterface->UpdateNodeImage(pgw->GetId(), sgwIcon);
+    animInterface->UpdateNodeImage(sgw->GetId(), pgwIcon);
+    animInterface->UpdateNodeImage(22, mmeIcon); // add icon to Node 22
+    animInterface->UpdateNodeImage(mme->GetId(), mmeIcon);
 
-    anim.UpdateNodeImage(remoteHost->GetId(), serverIcon);
+    animInterface->UpdateNodeImage(remoteHost->GetId(), serverIcon);
  }
 
     // --- ANIMATION BLOCK END ---
@@ -1550,7 +1615,7 @@ if (anim)
          // Cada UE tem seu tracking em momentos diferentes (offset de 100ms)
          double trackOffset = i * 0.1;
          Simulator::Schedule(Seconds(2.0 + trackOffset), &TrackUePosition, ueNodes.Get(i), i);
-         Simulator::Schedule(Seconds(2.5 + trackOffset), &LogPowerAndHandover, ueNodes.Get(i), i, gnbNodes);
+         Simulator::Schedule(Seconds(2.5 + trackOffset), &LogPowerAndHandover, ueNodes.Get(i), i);
      }
      
      // Schedule periodic position reports
@@ -1569,7 +1634,13 @@ if (anim)
  
      Simulator::Stop(simTime);
      Simulator::Run();
- 
+
+     // Trace files are written with '\n' (no per-row flush), so flush them once here
+     if (handoverFile.is_open()) handoverFile.close();
+     if (positionFile.is_open()) positionFile.close();
+     if (powerFile.is_open()) powerFile.close();
+     if (flowStatsFile.is_open()) flowStatsFile.close();
+
      /*
       * To check what was installed in the memory, i.e., BWPs of gNB Device, and its configuration.
       * Example is: Node 1 -> Device 0 -> BandwidthPartMap -> {0,1} BWPs -> NrGnbPhy -> Numerology,
@@ -1579,28 +1650,16 @@ if (anim)
  
      // Print per-flow statistics
      monitor->CheckForLostPackets();
-     FlowMonitor::FlowStatsContainer stats = monitor->GetFlowStats();
+     const FlowMonitor::FlowStatsContainer& stats = monitor->GetFlowStats();
  
      double averageFlowThroughput = 0.0;
      double averageFlowDelay = 0.0;
      double averageFlowJitter = 0.0;
      double totalChannelTime = simTime.GetSeconds(); // Total simulation time
-     double channelBusyTime = 0.0; // Accumulated time that channel is busy
- 
-     for (std::map<FlowId, FlowMonitor::FlowStats>::const_iterator i = stats.begin();
-     i != stats.end();
-     ++i)
-     {
-        double dataRate = 100e6; // Channel transmission rate (in bps, adjust as needed) 100 Mb/s
-        // double dataRate = (gNbNum * ueNumPergNb * targetRateMbpsVideo * 1e6) + (gNbNum * ueNumPergNb * targetRateMbpsBe * 1e6) + (gNbNum * ueNumPergNb * targetRateMbpsULL * 1e6); // Channel transmission rate (in bps, adjust as needed)
+     double dataRate = 100e6; // Channel transmission rate (in bps, adjust as needed) 100 Mb/s
+     // double dataRate = (gNbNum * ueNumPergNb * targetRateMbpsVideo * 1e6) + (gNbNum * ueNumPergNb * targetRateMbpsBe * 1e6) + (gNbNum * ueNumPergNb * targetRateMbpsULL * 1e6); // Channel transmission rate (in bps, adjust as needed)
 
-
-        // Calculate busy time on channel for this flow
-        double busyTime = (i->second.rxBytes * 8.0) / dataRate; // Busy time in seconds
-        channelBusyTime += busyTime;
-    }
-       
-     double channelUtilization = (channelBusyTime / totalChannelTime) * 100.0;
+     uint64_t totalRxBytes = 0; // Summed in the per-flow report loop below
      std::cout << " \n\n Output: \n\n\n - 1.0.0.2 (gNB) > 7.0.0.x (UE) - Downlink \n - 7.0.0.x (UE) > 1.0.0.2 (gNB) - Uplink \n\n" << std::endl;
     
 
@@ -1639,21 +1698,22 @@ if (anim)
          outFile << "  TxOffered:  " << i->second.txBytes * 8.0 / flowDuration / 1000.0 / 1000.0
                  << " Mbps\n";
          outFile << "  Rx Bytes:   " << i->second.rxBytes << "\n";
+         totalRxBytes += i->second.rxBytes;
          if (i->second.rxPackets > 0)
          {
              // Measure the duration of the flow from receiver's perspective
-             averageFlowThroughput += i->second.rxBytes * 8.0 / flowDuration / 1000 / 1000;
-             averageFlowDelay += 1000 * i->second.delaySum.GetSeconds() / i->second.rxPackets;
-             averageFlowJitter += 1000 * i->second.jitterSum.GetSeconds() / i->second.rxPackets;
- 
-             outFile << "  Throughput: " << i->second.rxBytes * 8.0 / flowDuration / 1000 / 1000
-                     << " Mbps\n";
-             outFile << "  Mean delay:  "
-                     << 1000 * i->second.delaySum.GetSeconds() / i->second.rxPackets << " ms\n";
+             double flowThroughput = i->second.rxBytes * 8.0 / flowDuration / 1000 / 1000;
+             double flowDelay = 1000 * i->second.delaySum.GetSeconds() / i->second.rxPackets;
+             double flowJitter = 1000 * i->second.jitterSum.GetSeconds() / i->second.rxPackets;
+             averageFlowThroughput += flowThroughput;
+             averageFlowDelay += flowDelay;
+             averageFlowJitter += flowJitter;
+ 
+             outFile << "  Throughput: " << flowThroughput << " Mbps\n";
+             outFile << "  Mean delay:  " << flowDelay << " ms\n";
              // outFile << "  Mean upt:  " << i->second.uptSum / i->second.rxPackets / 1000/1000 << "
              // Mbps \n";
-             outFile << "  Mean jitter:  "
-                     << 1000 * i->second.jitterSum.GetSeconds() / i->second.rxPackets << " ms\n";
+             outFile << "  Mean jitter:  " << flowJitter << " ms\n";
          }
          else
          {
@@ -1664,6 +1724,9 @@ if (anim)
          outFile << "  Rx Packets: " << i->second.rxPackets << "\n";
      }
  
+     double channelBusyTime = (totalRxBytes * 8.0) / dataRate; // Time that channel is busy, in seconds
+     double channelUtilization = (channelBusyTime / totalChannelTime) * 100.0;
+
      double meanFlowThroughput = averageFlowThroughput / stats.size();
      double meanFlowDelay = averageFlowDelay / stats.size();
      double meanFlowJitter = averageFlowJitter / stats.size();